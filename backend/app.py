@@ -1,6 +1,7 @@
 # backend/app.py
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
 import logging
@@ -15,6 +16,13 @@ logger = logging.getLogger("aarii.backend")
 # Create Flask app
 app = Flask(__name__)
 
+# Behind Render's proxy: take the client address from the last AARII_PROXY_HOPS X-Forwarded-For
+# entries (the ones our proxies appended), not from the client-controlled front of the list.
+# Set AARII_PROXY_HOPS=0 when the app is reached directly.
+_proxy_hops = int(os.getenv("AARII_PROXY_HOPS", "1"))
+if _proxy_hops > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_proxy_hops)
+
 # Enable CORS for React frontend (restrict before production)
 # For local dev this allows all origins under /api/*; change before production.
 CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -0,0 +1,203 @@
+# backend/core/admission.py
+"""
+Admission control for chat requests.
+
+- token buckets per session and per client address cap how fast one caller can send;
+  an empty bucket is rejected with 429 + Retry-After
+- a concurrency cap bounds how many chat turns run at once; waiters queue per
+  session and free slots are handed out round-robin across sessions, so one chatty
+  session cannot starve the others
+- a full queue, or a wait longer than AARII_QUEUE_TIMEOUT, is rejected with 503 + Retry-After
+
+State lives in each worker process. The AARII_* limits below are totals for the whole
+deployment and are divided across WEB_CONCURRENCY workers, so the effective global
+numbers stay roughly what was configured (per-session buckets are only approximate,
+since a session's requests land on either worker).
+
+Queued requests hold a gunicorn thread while they wait, so running + queued chat turns
+per worker must fit in WEB_THREADS minus AARII_RESERVED_THREADS (kept free for health,
+mode and voice requests); the queue is shrunk at startup if it would not fit.
+"""
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger("aarii.admission")
+
+# must match gunicorn's --workers / --threads (the start commands read the same variables)
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "2")))
+THREADS = max(1, int(os.getenv("WEB_THREADS", "8")))
+RESERVED_THREADS = int(os.getenv("AARII_RESERVED_THREADS", "2"))
+
+def _per_worker(total: float) -> float:
+    return total / WORKERS
+
+SESSION_RATE = _per_worker(float(os.getenv("AARII_SESSION_RATE", "0.5")))      # tokens / second
+SESSION_BURST = max(1.0, _per_worker(float(os.getenv("AARII_SESSION_BURST", "6"))))
+CLIENT_RATE = _per_worker(float(os.getenv("AARII_CLIENT_RATE", "2")))
+CLIENT_BURST = max(1.0, _per_worker(float(os.getenv("AARII_CLIENT_BURST", "20"))))
+MAX_CONCURRENT = max(1, math.ceil(_per_worker(int(os.getenv("AARII_MAX_CONCURRENT", "6")))))
+MAX_QUEUE = max(0, math.ceil(_per_worker(int(os.getenv("AARII_MAX_QUEUE", "6")))))
+MAX_QUEUE_PER_SESSION = int(os.getenv("AARII_MAX_QUEUE_PER_SESSION", "2"))
+QUEUE_TIMEOUT = float(os.getenv("AARII_QUEUE_TIMEOUT", "10"))
+BUCKET_IDLE_TTL = 600.0
+
+def _thread_budget(max_concurrent: int, max_queue: int):
+    """Clamps (max_concurrent, max_queue) so chat turns never take the reserved threads."""
+    budget = max(1, THREADS - RESERVED_THREADS)
+    if max_concurrent + max_queue <= budget:
+        return max_concurrent, max_queue
+    concurrent = min(max_concurrent, budget)
+    queue = budget - concurrent
+    logger.warning(
+        "admission limits (concurrent=%d, queue=%d per worker) exceed %d threads - %d reserved; using concurrent=%d, queue=%d",
+        max_concurrent, max_queue, THREADS, RESERVED_THREADS, concurrent, queue,
+    )
+    return concurrent, queue
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Consumes one token; returns 0 on success, otherwise seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+class _Waiter:
+    __slots__ = ("key", "granted")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.granted = False
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, max_queue: int = MAX_QUEUE,
+                 max_queue_per_session: int = MAX_QUEUE_PER_SESSION, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrent, self.max_queue = _thread_budget(max_concurrent, max_queue)
+        self.max_queue_per_session = max_queue_per_session
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        # session key -> deque of waiters; iteration order is the round-robin order
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        self.counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self._wait_total = 0.0
+
+    def _bucket(self, key: str, rate: float, burst: float) -> TokenBucket:
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = TokenBucket(rate, burst)
+        return b
+
+    def _sweep_buckets(self, now: float) -> None:
+        # drop buckets idle long enough to have refilled completely
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for key in [k for k, b in self._buckets.items() if now - b.updated > BUCKET_IDLE_TTL]:
+            del self._buckets[key]
+
+    def acquire(self, session_id: str, client: Optional[str] = None) -> None:
+        """Blocks until the request may run. Raises AdmissionRejected (429/503) otherwise."""
+        with self._cond:
+            now = time.monotonic()
+            self._sweep_buckets(now)
+            wait_for = self._bucket("s:" + session_id, SESSION_RATE, SESSION_BURST).take(now)
+            if not wait_for and client:
+                wait_for = self._bucket("c:" + client, CLIENT_RATE, CLIENT_BURST).take(now)
+            if wait_for:
+                self.counters["rate_limited"] += 1
+                raise AdmissionRejected(429, "rate_limited", wait_for)
+
+            if self._active < self.max_concurrent and self._queued == 0:
+                self._active += 1
+                self.counters["admitted"] += 1
+                return
+
+            q = self._queues.get(session_id)
+            if self._queued >= self.max_queue or (q is not None and len(q) >= self.max_queue_per_session):
+                self.counters["queue_full"] += 1
+                raise AdmissionRejected(503, "queue_full", self.queue_timeout / 2)
+
+            waiter = _Waiter(session_id)
+            if q is None:
+                q = self._queues[session_id] = deque()
+            q.append(waiter)
+            self._queued += 1
+            self.counters["queued"] += 1
+
+            deadline = now + self.queue_timeout
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            self._wait_total += time.monotonic() - now
+            if waiter.granted:
+                self.counters["admitted"] += 1
+                return
+
+            q.remove(waiter)
+            if not q:
+                del self._queues[session_id]
+            self._queued -= 1
+            self.counters["queue_timeout"] += 1
+            raise AdmissionRejected(503, "queue_timeout", self.queue_timeout / 2)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._grant_next()
+
+    def _grant_next(self) -> None:
+        # hand the freed slot to the head of the next session's queue, then rotate that session to the back
+        while self._queues and self._active < self.max_concurrent:
+            key, q = next(iter(self._queues.items()))
+            waiter = q.popleft()
+            self._queued -= 1
+            if q:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            waiter.granted = True
+            self._active += 1
+        self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out = dict(self.counters)
+            out.update({
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": self._queued,
+                "queued_sessions": len(self._queues),
+                "max_queue": self.max_queue,
+                "workers": WORKERS,
+                "avg_queue_wait_ms": round(self._wait_total / out["queued"] * 1000, 1) if out["queued"] else 0.0,
+            })
+            return out
+
+admission = AdmissionController()
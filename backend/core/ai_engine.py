@@ -9,12 +9,21 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_BASE = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+# optional secondary model used while the primary's circuit breaker is open
+GROQ_FALLBACK_MODEL = os.getenv("GROQ_FALLBACK_MODEL")
 
 if not GROQ_API_KEY:
     raise ValueError("GROQ_API_KEY not set in .env")
 
 client = OpenAI(api_key=GROQ_API_KEY, base_url=GROQ_BASE, timeout=60)
 
+try:
+    from backend.core.llm_client import ResilientLLMClient, LLMUnavailableError
+except ImportError:
+    from core.llm_client import ResilientLLMClient, LLMUnavailableError
+
+llm = ResilientLLMClient(client, GROQ_MODEL, fallback_model=GROQ_FALLBACK_MODEL)
+
 # DB logging (best-effort)
 try:
     from database.models import SessionLocal, ChatLog
@@ -22,9 +31,17 @@ try:
 except Exception:
     DB_AVAILABLE = False
 
+# per-session mode / prompt / generation params (cached)
+try:
+    from backend.core.session_settings import get_session_settings
+except Exception:
+    def get_session_settings(session_id: str):
+        return None
+
 class AariiEngine:
     def __init__(self):
         self.model = GROQ_MODEL
+        self.llm = llm
         self.system_prompt = os.getenv("AARII_SYSTEM_PROMPT", "You are Aarii, a helpful, concise AI assistant.")
 
     def _log(self, session_id: str, role: str, content: str):
@@ -39,9 +56,13 @@ class AariiEngine:
         except Exception:
             pass
 
-    def get_response(self, user_message: str, session_id: str = "default", history: Optional[List[Dict[str, str]]] = None, max_history_messages: int = 12) -> Tuple[str, dict]:
+    def get_response(self, user_message: str, session_id: str = "default", history: Optional[List[Dict[str, str]]] = None, max_history_messages: int = 12, summary: Optional[str] = None, context: Optional[List[Dict[str, str]]] = None) -> Tuple[str, dict]:
         """
         history: list of {role: 'user'|'assistant'|'system', content: '...'}, in chronological order oldest->newest.
+        summary: rolling summary of turns older than `history`; sent as its own system message,
+                 outside the history window.
+        context: retrieved system messages (knowledge passages, memories); always sent,
+                 never counted against max_history_messages.
         """
         if history is None:
             history = []
@@ -49,8 +70,21 @@ class AariiEngine:
         # Limit history
         history = history[-max_history_messages:]
 
-        messages = [{"role": "system", "content": self.system_prompt}]
-        # add history (already may include memory system messages)
+        settings = get_session_settings(session_id) or {}
+        system_prompt = settings.get("system_prompt") or self.system_prompt
+        temperature = settings.get("temperature")
+        if temperature is None:
+            temperature = float(os.getenv("AARII_TEMP", "0.2"))
+        max_tokens = settings.get("max_tokens")
+        if max_tokens is None:
+            max_tokens = int(os.getenv("AARII_MAX_TOKENS", "512"))
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        for item in context or []:
+            messages.append({"role": "system", "content": item.get("content", "")})
+        # add history
         for item in history:
             role = item.get("role", "user")
             content = item.get("content", "")
@@ -59,47 +93,17 @@ class AariiEngine:
         # finally append current user message
         messages.append({"role": "user", "content": user_message})
 
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": float(os.getenv("AARII_TEMP", "0.2")),
-            "max_tokens": int(os.getenv("AARII_MAX_TOKENS", "512")),
+        params = {
+            "temperature": temperature,
+            "max_tokens": max_tokens,
             "n": 1,
         }
 
         try:
-            resp = client.chat.completions.create(**payload)
-            # Extract reply safely
-            reply = "(no reply)"
-            try:
-                choices = getattr(resp, "choices", None)
-                if choices and len(choices) > 0:
-                    first = choices[0]
-                    msg = getattr(first, "message", None)
-                    if msg and getattr(msg, "content", None):
-                        reply = msg.content
-                    else:
-                        reply = getattr(first, "text", None) or str(first)
-            except Exception:
-                reply = str(resp)
-
-            if reply is None:
+            reply, meta = self.llm.complete(messages, **params)
+            if not reply:
                 reply = "(no reply from model)"
 
-            # Meta: try to produce JSON-serializable meta
-            meta = {}
-            try:
-                if hasattr(resp, "to_dict"):
-                    meta = {"raw": resp.to_dict()}
-                else:
-                    meta = {
-                        "model": getattr(resp, "model", None),
-                        "choices_count": len(getattr(resp, "choices", []) or []),
-                        "raw_str": str(resp),
-                    }
-            except Exception:
-                meta = {"raw_str": str(resp)}
-
             # log
             try:
                 self._log(session_id, "user", user_message)
@@ -109,5 +113,33 @@ class AariiEngine:
 
             return reply, meta
 
+        except LLMUnavailableError as e:
+            return f"⚠️ Aarii error contacting Groq: {e}", {"error": str(e), "unavailable": True}
         except Exception as e:
             return f"⚠️ Aarii error contacting Groq: {e}", {"error": str(e)}
+
+    def summarize(self, previous_summary: str, messages: List[Dict[str, str]]) -> str:
+        """
+        Folds `messages` into `previous_summary` and returns the new summary.
+        Runs as a background LLM call (no retries/hedging, never trips the user-facing breaker);
+        raises LLMUnavailableError if no healthy upstream answers.
+        """
+        transcript = "\n".join(
+            f"{'User' if m.get('role') == 'user' else 'Assistant'}: {m.get('content', '')[:2000]}" for m in messages
+        )
+        prompt = (
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}\n\n"
+            "Rewrite the summary so it also covers the new messages. Keep facts about the user, "
+            "decisions, open questions and anything the assistant promised. At most 200 words, plain prose."
+        )
+        reply, _meta = self.llm.complete(
+            background=True,
+            messages=[
+                {"role": "system", "content": "You maintain a running summary of a conversation between a user and Aarii."},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.0,
+            max_tokens=int(os.getenv("AARII_SUMMARY_MAX_TOKENS", "320")),
+        )
+        return reply
@@ -0,0 +1,346 @@
+# backend/core/llm_client.py
+"""
+Resilient wrapper around the Groq (OpenAI-compatible) chat completions client.
+
+- every call streams, so a short read timeout acts as a first-token deadline
+- if the first token has not arrived after ~p95 time-to-first-token, a duplicate
+  (hedge) request is sent; the first leg to produce a token wins, the other is dropped
+- failed calls are retried with jittered exponential backoff inside an overall deadline
+- each upstream model has a circuit breaker; while the primary is open we fail fast
+  or go straight to the fallback model (GROQ_FALLBACK_MODEL)
+- per-upstream latency / outcome counters are available via stats()
+"""
+import os
+import time
+import random
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+import openai
+
+logger = logging.getLogger("aarii.llm_client")
+
+FIRST_TOKEN_TIMEOUT = float(os.getenv("AARII_FIRST_TOKEN_TIMEOUT", "8"))
+CONNECT_TIMEOUT = float(os.getenv("AARII_CONNECT_TIMEOUT", "3"))
+# deadline for getting the first token (across retries / fallback); once a reply is streaming,
+# only the read timeout (max gap between chunks) and GENERATION_TIMEOUT bound it
+LLM_DEADLINE = float(os.getenv("AARII_LLM_DEADLINE", "25"))
+GENERATION_TIMEOUT = float(os.getenv("AARII_GENERATION_TIMEOUT", "90"))
+LLM_RETRIES = int(os.getenv("AARII_LLM_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("AARII_BACKOFF_BASE", "0.25"))
+BACKOFF_CAP = float(os.getenv("AARII_BACKOFF_CAP", "2"))
+HEDGE_ENABLED = os.getenv("AARII_HEDGE", "true").lower() in ("1", "true", "yes")
+HEDGE_DEFAULT_DELAY = float(os.getenv("AARII_HEDGE_DELAY", "1.5"))
+HEDGE_MIN_DELAY = float(os.getenv("AARII_HEDGE_MIN_DELAY", "0.3"))
+HEDGE_MIN_SAMPLES = 20
+BREAKER_FAILURES = int(os.getenv("AARII_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("AARII_BREAKER_RESET", "30"))
+POOL_SIZE = int(os.getenv("AARII_LLM_POOL", "16"))
+
+class LLMUnavailableError(Exception):
+    """All upstreams failed, timed out or are short-circuited."""
+
+class _LegCancelled(Exception):
+    pass
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code >= 500 or exc.status_code in (408, 409, 429)
+    # connection drops / timeouts (also mid-stream), and error events inside a stream,
+    # which the SDK raises as a bare APIError
+    return isinstance(exc, (openai.APIError, httpx.TransportError, TimeoutError))
+
+def _is_client_error(exc: Exception) -> bool:
+    return isinstance(exc, openai.APIStatusError) and 400 <= exc.status_code < 500
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+class UpstreamStats:
+    """Rolling latency window plus outcome counters for one upstream model."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self.ttft = deque(maxlen=window)
+        self.latency = deque(maxlen=window)
+        self.counters = {
+            "requests": 0, "successes": 0, "failures": 0, "timeouts": 0,
+            "hedges": 0, "hedge_wins": 0, "retries": 0, "short_circuits": 0,
+        }
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, ttft: float, latency: float) -> None:
+        with self._lock:
+            self.ttft.append(ttft)
+            self.latency.append(latency)
+
+    def ttft_p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.ttft) < HEDGE_MIN_SAMPLES:
+                return None
+            return _percentile(list(self.ttft), 95)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ttft, latency = list(self.ttft), list(self.latency)
+            out = dict(self.counters)
+        ms = lambda v: None if v is None else round(v * 1000, 1)
+        out.update({
+            "samples": len(latency),
+            "ttft_p50_ms": ms(_percentile(ttft, 50)),
+            "ttft_p95_ms": ms(_percentile(ttft, 95)),
+            "latency_p50_ms": ms(_percentile(latency, 50)),
+            "latency_p95_ms": ms(_percentile(latency, 95)),
+            "latency_p99_ms": ms(_percentile(latency, 99)),
+        })
+        return out
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `reset_timeout` seconds, letting a single probe through;
+    the probe's outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def is_closed(self) -> bool:
+        with self._lock:
+            return self.state == "closed"
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("circuit opened after %d failures", self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+class _HedgeRace:
+    """Shared between the legs of one hedged call: the first leg to stream a token claims the win."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner: Optional[int] = None
+        self.first_token = threading.Event()
+
+    def claim(self, leg: int) -> bool:
+        with self._lock:
+            if self.winner is None:
+                self.winner = leg
+                self.first_token.set()
+            return self.winner == leg
+
+    def lost(self, leg: int) -> bool:
+        return self.winner is not None and self.winner != leg
+
+class ResilientLLMClient:
+    def __init__(self, client: openai.OpenAI, primary_model: str, fallback_model: Optional[str] = None):
+        # retries are handled here, not by the SDK
+        self._client = client.with_options(max_retries=0)
+        self.upstreams = [primary_model] + ([fallback_model] if fallback_model and fallback_model != primary_model else [])
+        self._stats = {m: UpstreamStats() for m in self.upstreams}
+        self._breakers = {m: CircuitBreaker() for m in self.upstreams}
+        self._pool = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="aarii-llm")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            m: dict(self._stats[m].snapshot(), breaker=self._breakers[m].snapshot())
+            for m in self.upstreams
+        }
+
+    def complete(self, messages: List[Dict[str, str]], background: bool = False, **params) -> Tuple[str, Dict[str, Any]]:
+        """
+        Returns (reply, info) from the first healthy upstream.
+        Raises LLMUnavailableError when every upstream failed or is short-circuited.
+        Non-retryable upstream errors (bad request, auth, ...) are re-raised as-is and
+        not sent to the fallback, which would reject the same request.
+
+        background=True is for housekeeping calls (e.g. summaries): a single attempt, no hedge,
+        only on upstreams whose breaker is closed, and its outcome is not recorded on the
+        breakers, so it can neither trip them nor use up a half-open probe meant for user traffic.
+        """
+        deadline = time.monotonic() + LLM_DEADLINE
+        last_error: Optional[Exception] = None
+        for model in self.upstreams:
+            if time.monotonic() >= deadline:
+                break
+            breaker = self._breakers[model]
+            if not (breaker.is_closed() if background else breaker.allow()):
+                self._stats[model].incr("short_circuits")
+                last_error = last_error or LLMUnavailableError(f"circuit open for {model}")
+                continue
+            try:
+                if background:
+                    reply, info = self._hedged_call(model, messages, params, deadline, hedge=False)
+                    info["attempts"] = 1
+                else:
+                    reply, info = self._call_with_retries(model, messages, params, deadline)
+                info["fallback"] = model != self.upstreams[0]
+                return reply, info
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                logger.warning("upstream %s failed: %s", model, e)
+                last_error = e
+        raise LLMUnavailableError(str(last_error or "deadline exceeded"))
+
+    def _call_with_retries(self, model: str, messages, params, deadline: float):
+        stats, breaker = self._stats[model], self._breakers[model]
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                reply, info = self._hedged_call(model, messages, params, deadline)
+            except Exception as e:
+                if not _is_retryable(e):
+                    if _is_client_error(e):
+                        # bad request / auth: the upstream answered, so it counts as healthy
+                        breaker.record_success()
+                    raise
+                breaker.record_failure()
+                stats.incr("failures")
+                if isinstance(e, (TimeoutError, httpx.TimeoutException, openai.APITimeoutError)):
+                    stats.incr("timeouts")
+                backoff = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** (attempt - 1))))
+                if attempt > LLM_RETRIES or time.monotonic() + backoff >= deadline or not breaker.allow():
+                    raise
+                stats.incr("retries")
+                time.sleep(backoff)
+                continue
+            breaker.record_success()
+            stats.incr("successes")
+            info["attempts"] = attempt
+            return reply, info
+
+    def _hedge_delay(self, model: str) -> float:
+        p95 = self._stats[model].ttft_p95()
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(p95, HEDGE_MIN_DELAY), FIRST_TOKEN_TIMEOUT)
+
+    def _hedged_call(self, model: str, messages, params, deadline: float, hedge: bool = HEDGE_ENABLED):
+        stats = self._stats[model]
+        race = _HedgeRace()
+        legs = [self._pool.submit(self._stream_once, model, messages, params, deadline, race, 0)]
+        stats.incr("requests")
+
+        if hedge:
+            delay = min(self._hedge_delay(model), max(0.0, deadline - time.monotonic()))
+            if not race.first_token.wait(delay) and not legs[0].done():
+                stats.incr("hedges")
+                legs.append(self._pool.submit(self._stream_once, model, messages, params, deadline, race, 1))
+
+        pending = set(legs)
+        last_error: Optional[Exception] = None
+        while pending:
+            # a leg that is already streaming bounds itself (read timeout / GENERATION_TIMEOUT)
+            timeout = None if race.first_token.is_set() else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if race.first_token.is_set():
+                    continue
+                race.claim(-1)  # make any still-running leg bail out
+                raise TimeoutError(f"{model}: no first token within deadline")
+            for fut in done:
+                err = fut.exception()
+                if err is None:
+                    reply, info = fut.result()
+                    info["hedged"] = len(legs) > 1
+                    if fut is not legs[0]:
+                        stats.incr("hedge_wins")
+                    return reply, info
+                if not isinstance(err, _LegCancelled):
+                    last_error = err
+        raise last_error or TimeoutError(f"{model}: all legs cancelled")
+
+    def _stream_once(self, model: str, messages, params, deadline: float, race: _HedgeRace, leg: int):
+        start = time.monotonic()
+        remaining = max(0.1, deadline - start)
+        # read timeout doubles as the first-token timeout and the max gap between chunks
+        timeout = httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining), read=min(FIRST_TOKEN_TIMEOUT, remaining))
+        stream = self._client.chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=timeout, **params
+        )
+        parts: List[str] = []
+        ttft = None
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if race.lost(leg):
+                    raise _LegCancelled()
+                now = time.monotonic()
+                if ttft is None and now >= deadline:
+                    raise TimeoutError(f"{model}: no first token within deadline")
+                if ttft is not None and now - start >= GENERATION_TIMEOUT:
+                    # the upstream is working, just long: keep what we have rather than retrying
+                    finish_reason = "generation_timeout"
+                    break
+                choices = getattr(chunk, "choices", None) or []
+                if not choices:
+                    continue
+                delta = getattr(choices[0], "delta", None)
+                content = getattr(delta, "content", None) if delta else None
+                if content:
+                    if ttft is None:
+                        if not race.claim(leg):
+                            raise _LegCancelled()
+                        ttft = time.monotonic() - start
+                    parts.append(content)
+                finish_reason = getattr(choices[0], "finish_reason", None) or finish_reason
+        finally:
+            stream.close()
+
+        if ttft is None and not race.claim(leg):
+            raise _LegCancelled()
+        latency = time.monotonic() - start
+        self._stats[model].observe(ttft if ttft is not None else latency, latency)
+        info = {
+            "model": model,
+            "latency_ms": round(latency * 1000, 1),
+            "ttft_ms": None if ttft is None else round(ttft * 1000, 1),
+            "finish_reason": finish_reason,
+        }
+        return "".join(parts), info
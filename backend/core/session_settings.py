@@ -0,0 +1,120 @@
+# backend/core/session_settings.py
+"""
+Per-session settings (mode, system prompt, generation parameters) stored in the
+`sessions` table and served through a small in-process TTL cache, so a chat turn
+does not hit the DB just to find out which prompt to use.
+
+The cache is per worker process: a write refreshes the local entry immediately,
+other workers pick the change up once their entry expires. Sessions without settings
+are cached only briefly (AARII_SETTINGS_MISS_TTL), so a mode set for a new session
+applies on the next turn whichever worker serves it; changes to existing settings
+reach other workers within AARII_SETTINGS_TTL.
+"""
+import os
+import time
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+try:
+    from backend.database.models import SessionLocal, Session
+    DB_AVAILABLE = True
+except Exception:
+    DB_AVAILABLE = False
+
+logger = logging.getLogger("aarii.session_settings")
+
+SETTINGS_TTL = float(os.getenv("AARII_SETTINGS_TTL", "15"))
+SETTINGS_MISS_TTL = float(os.getenv("AARII_SETTINGS_MISS_TTL", "2"))
+SETTINGS_FIELDS = ("mode", "system_prompt", "temperature", "max_tokens")
+
+class TTLCache:
+    """Small thread-safe key -> value cache with a fixed time-to-live; None is a cacheable value."""
+
+    _MISS = object()
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+        if hit is None or hit[0] <= time.monotonic():
+            return default
+        return hit[1]
+
+    def put(self, key: str, value, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                # drop expired entries so idle sessions don't accumulate forever
+                self._data = {k: v for k, v in self._data.items() if v[0] > now}
+            self._data[key] = (now + (self.ttl if ttl is None else ttl), value)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+_cache = TTLCache(SETTINGS_TTL)
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    return {f: getattr(row, f) for f in SETTINGS_FIELDS}
+
+def invalidate(session_id: Optional[str] = None) -> None:
+    _cache.invalidate(session_id)
+
+def get_session_settings(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns {mode, system_prompt, temperature, max_tokens} for the session, or None if
+    nothing was set. Misses are cached too, so sessions without settings cost no DB reads.
+    """
+    hit = _cache.get(session_id, TTLCache._MISS)
+    if hit is not TTLCache._MISS:
+        return hit
+
+    if not DB_AVAILABLE:
+        return None
+    try:
+        db = SessionLocal()
+        row = db.query(Session).filter(Session.session_id == session_id).first()
+        settings = _row_to_dict(row) if row else None
+        db.close()
+    except Exception:
+        logger.exception("settings fetch failed for %s", session_id)
+        return None
+
+    _cache.put(session_id, settings, ttl=None if settings is not None else SETTINGS_MISS_TTL)
+    return settings
+
+def set_session_settings(session_id: str, **fields) -> Dict[str, Any]:
+    """
+    Upserts the given fields (any of SETTINGS_FIELDS; None clears a field) and refreshes the cache.
+    Returns the stored settings.
+    """
+    unknown = set(fields) - set(SETTINGS_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown settings: {', '.join(sorted(unknown))}")
+    if not DB_AVAILABLE:
+        raise RuntimeError("db not available")
+
+    db = SessionLocal()
+    try:
+        row = db.query(Session).filter(Session.session_id == session_id).first()
+        if row is None:
+            row = Session(session_id=session_id)
+            db.add(row)
+        for name, value in fields.items():
+            setattr(row, name, value)
+        db.commit()
+        settings = _row_to_dict(row)
+    finally:
+        db.close()
+
+    _cache.put(session_id, settings)
+    return settings
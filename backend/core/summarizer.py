@@ -0,0 +1,155 @@
+# backend/core/summarizer.py
+"""
+Rolling per-session conversation summary.
+
+Once a session has accumulated enough raw turns past its current summary, a background
+job folds the older ones (all but the newest SUMMARY_KEEP_RAW messages) into the summary
+and advances `last_chatlog_id`. Chat turns then send the summary plus only the raw
+messages after that id, so prompt size stays bounded without dropping older context.
+"""
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+try:
+    from backend.database.models import SessionLocal, ChatLog, ConversationSummary
+    DB_AVAILABLE = True
+except Exception:
+    DB_AVAILABLE = False
+
+try:
+    from backend.core.session_settings import TTLCache
+except Exception:
+    from core.session_settings import TTLCache
+
+logger = logging.getLogger("aarii.summarizer")
+
+SUMMARY_EVERY = int(os.getenv("AARII_SUMMARY_EVERY", "4"))          # turns (user+assistant pairs)
+SUMMARY_KEEP_RAW = int(os.getenv("AARII_SUMMARY_KEEP_RAW", "6"))    # newest messages never folded
+SUMMARY_MAX_CHARS = int(os.getenv("AARII_SUMMARY_MAX_CHARS", "2000"))
+SUMMARY_MAX_FOLD = int(os.getenv("AARII_SUMMARY_MAX_FOLD", "40"))  # messages folded per job at most
+# raw messages the engine keeps per turn; chat() fetches no more history than this
+HISTORY_WINDOW = int(os.getenv("AARII_HISTORY_WINDOW", "12"))
+# raw messages past the summary that trigger a new fold; capped so a full window
+# (+ the current turn's two rows) always counts as due
+TRIGGER_MESSAGES = min(SUMMARY_KEEP_RAW + 2 * SUMMARY_EVERY, HISTORY_WINDOW + 2)
+# after a failed fold, wait this long (doubling per consecutive failure) before trying that session again
+FAILURE_BACKOFF = float(os.getenv("AARII_SUMMARY_BACKOFF", "60"))
+FAILURE_BACKOFF_MAX = 1800.0
+
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aarii-summary")
+_inflight = set()
+_inflight_lock = threading.Lock()
+# session_id -> (consecutive failures, retry not before)
+_failures: Dict[str, Tuple[int, float]] = {}
+# session_id -> (summary, last_chatlog_id); entries are revalidated against last_chatlog_id
+# on every read, the TTL only lets idle sessions fall out
+_summary_cache = TTLCache(3600)
+
+def get_summary(session_id: str) -> Tuple[str, int]:
+    """
+    Returns (summary, last_chatlog_id); ("", 0) when the session has no summary yet.
+    Only last_chatlog_id is read each time; the summary text comes from the cache unless
+    a fold (possibly by another worker) has moved it on.
+    """
+    if not DB_AVAILABLE:
+        return "", 0
+    cached = _summary_cache.get(session_id)
+    try:
+        db = SessionLocal()
+        try:
+            q = db.query(ConversationSummary).filter(ConversationSummary.session_id == session_id)
+            current = q.with_entities(ConversationSummary.last_chatlog_id).first()
+            if current is None:
+                return "", 0
+            last_id = current[0] or 0
+            if cached is not None and cached[1] == last_id:
+                return cached
+            summary = q.with_entities(ConversationSummary.summary).scalar()
+        finally:
+            db.close()
+    except Exception:
+        logger.exception("summary fetch failed for %s", session_id)
+        return "", 0
+    result = (summary or "", last_id)
+    _summary_cache.put(session_id, result)
+    return result
+
+def maybe_schedule_summary(session_id: str, pending_messages: int, summarize_fn: Callable[[str, List[Dict[str, str]]], str]) -> bool:
+    """
+    Queues a background fold when `pending_messages` (raw messages after the current summary)
+    reaches TRIGGER_MESSAGES. At most one job per session is in flight. Returns True if queued.
+    """
+    if not DB_AVAILABLE or pending_messages < TRIGGER_MESSAGES:
+        return False
+    with _inflight_lock:
+        failure = _failures.get(session_id)
+        if session_id in _inflight or (failure and failure[1] > time.monotonic()):
+            return False
+        _inflight.add(session_id)
+    _pool.submit(_run, session_id, summarize_fn)
+    return True
+
+def _run(session_id: str, summarize_fn) -> None:
+    ok = False
+    try:
+        update_summary(session_id, summarize_fn)
+        ok = True
+    except Exception as e:
+        logger.warning("summary update failed for %s: %s", session_id, e)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(session_id)
+            if ok:
+                _failures.pop(session_id, None)
+            else:
+                count = _failures.get(session_id, (0, 0.0))[0] + 1
+                delay = min(FAILURE_BACKOFF_MAX, FAILURE_BACKOFF * (2 ** (count - 1)))
+                _failures[session_id] = (count, time.monotonic() + delay)
+
+def update_summary(session_id: str, summarize_fn: Callable[[str, List[Dict[str, str]]], str]) -> bool:
+    """Folds all but the newest SUMMARY_KEEP_RAW messages into the summary. Returns True if it changed."""
+    previous, last_id = get_summary(session_id)
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ChatLog.id, ChatLog.role, ChatLog.content)
+            .filter(ChatLog.session_id == session_id, ChatLog.id > last_id, ChatLog.role.in_(("user", "assistant")))
+            .order_by(ChatLog.id.asc())
+            .all()
+        )
+    finally:
+        db.close()
+
+    to_fold = rows[:-SUMMARY_KEEP_RAW] if SUMMARY_KEEP_RAW else rows
+    if not to_fold:
+        return False
+    # a long session that never had a summary would not fit in one prompt; older turns are dropped,
+    # as they were before summaries existed
+    to_fold = to_fold[-SUMMARY_MAX_FOLD:]
+
+    summary = summarize_fn(previous, [{"role": r.role, "content": r.content} for r in to_fold]).strip()
+    if not summary:
+        return False
+    summary = summary[:SUMMARY_MAX_CHARS]
+
+    db = SessionLocal()
+    try:
+        row = db.query(ConversationSummary).filter(ConversationSummary.session_id == session_id).first()
+        if row is None:
+            row = ConversationSummary(session_id=session_id)
+            db.add(row)
+        elif (row.last_chatlog_id or 0) != last_id:
+            # another worker folded these turns while we were summarizing
+            return False
+        row.summary = summary
+        row.last_chatlog_id = to_fold[-1].id
+        db.commit()
+    finally:
+        db.close()
+    _summary_cache.put(session_id, (summary, to_fold[-1].id))
+    return True
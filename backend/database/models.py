@@ -1,7 +1,8 @@
 # backend/database/models.py
 import os
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, UniqueConstraint
+from sqlalchemy import create_engine, inspect, text, func, select, Column, Integer, Float, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./aarii_chatlogs.db")
@@ -23,10 +24,30 @@ class ChatLog(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 class Session(Base):
+    """
+    Per-session settings (mode, system prompt, generation parameters).
+    NULL columns mean "use the engine default".
+    """
     __tablename__ = "sessions"
     id = Column(Integer, primary_key=True)
     session_id = Column(String(128), unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    mode = Column(String(64), nullable=True)
+    system_prompt = Column(Text, nullable=True)
+    temperature = Column(Float, nullable=True)
+    max_tokens = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ConversationSummary(Base):
+    """
+    Rolling summary of a session's older turns; covers every ChatLog row with id <= last_chatlog_id.
+    """
+    __tablename__ = "conversation_summaries"
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(128), unique=True, index=True)
+    summary = Column(Text, default="")
+    last_chatlog_id = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class MemoryIndexMapping(Base):
     """
@@ -41,8 +62,63 @@ class MemoryIndexMapping(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     __table_args__ = (UniqueConstraint("faiss_index", "memory_row_id", name="_faiss_mem_uc"),)
 
+# columns added to existing tables after their first release
+_ADDED_COLUMNS = {
+    Session.__table__: ("mode", "system_prompt", "temperature", "max_tokens", "updated_at"),
+}
+
+def _add_missing_columns():
+    # create_all() never alters existing tables, so older DBs need the new columns added by hand
+    for table, names in _ADDED_COLUMNS.items():
+        insp = inspect(engine)
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for name in names:
+            if name in existing:
+                continue
+            ddl = table.c[name].type.compile(engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {ddl}"))
+            except DBAPIError:
+                # another worker starting at the same time may have added it first
+                if name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+                    raise
+
+def _backfill_session_prompts():
+    # mode prompts used to be stored as "system" ChatLog rows; give each session that has no
+    # settings row yet its latest one as system_prompt (one-time: later runs find the rows present)
+    latest = (
+        select(ChatLog.session_id, func.max(ChatLog.id).label("last_id"))
+        .where(ChatLog.role == "system")
+        .group_by(ChatLog.session_id)
+        .subquery()
+    )
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(ChatLog.session_id, ChatLog.content)
+            .join(latest, ChatLog.id == latest.c.last_id)
+            .outerjoin(Session, Session.session_id == ChatLog.session_id)
+            .where(Session.id.is_(None))
+        ).all()
+        for session_id, content in rows:
+            if not session_id or not (content or "").strip():
+                continue
+            try:
+                db.add(Session(session_id=session_id, system_prompt=content))
+                db.commit()
+            except IntegrityError:
+                # another worker backfilled this session at the same time
+                db.rollback()
+    finally:
+        db.close()
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _backfill_session_prompts()
 
 # auto-init on import
 init_db()
@@ -0,0 +1,304 @@
+# backend/memory/knowledge.py
+"""
+Knowledge base built from documents (PDF / text), kept apart from chat memory:
+its own FAISS index (ids = kb_chunks.id) and its own metadata tables.
+
+Ingestion streams each file page by page / line by line, chunks it into overlapping
+word windows and embeds chunks in batches, so memory use does not grow with document size.
+Files are re-ingested only when their content hash changes.
+
+    python -m backend.memory.knowledge docs/            # ingest / refresh
+    python -m backend.memory.knowledge docs/ --prune    # also drop documents no longer on disk
+"""
+import os
+import hashlib
+import logging
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import faiss
+
+from backend.memory.store import emb_model, embed_query, EMBED_DIM, _conn, _normalize
+
+logger = logging.getLogger("aarii.knowledge")
+
+BASE = os.path.dirname(__file__)
+KB_INDEX_FILE = os.path.join(BASE, "knowledge_index.index")
+
+CHUNK_WORDS = int(os.getenv("AARII_KB_CHUNK_WORDS", "180"))
+CHUNK_OVERLAP = int(os.getenv("AARII_KB_CHUNK_OVERLAP", "30"))
+EMBED_BATCH = int(os.getenv("AARII_KB_EMBED_BATCH", "64"))
+KB_MIN_SCORE = float(os.getenv("AARII_KB_MIN_SCORE", "0.3"))
+TEXT_EXTENSIONS = (".txt", ".md")
+SUPPORTED_EXTENSIONS = (".pdf",) + TEXT_EXTENSIONS
+
+# in-process copy of the index for queries; reloaded when the file on disk changes
+_index_cache = {"index": None, "mtime": None}
+_index_lock = threading.Lock()
+
+def init_db():
+    c = _conn()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS kb_documents (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      path TEXT UNIQUE,
+      content_hash TEXT,
+      chunk_count INTEGER DEFAULT 0,
+      ingested_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS kb_chunks (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      document_id INTEGER,
+      chunk_index INTEGER,
+      page INTEGER,
+      text TEXT
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_kb_chunks_document_id ON kb_chunks (document_id)")
+    c.commit()
+    c.close()
+
+def _load_index():
+    if os.path.exists(KB_INDEX_FILE):
+        return faiss.read_index(KB_INDEX_FILE)
+    # explicit ids so chunks of a changed document can be removed
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(EMBED_DIM))
+
+def _save_index(idx):
+    faiss.write_index(idx, KB_INDEX_FILE)
+
+def _cached_index():
+    if not os.path.exists(KB_INDEX_FILE):
+        return None
+    mtime = os.path.getmtime(KB_INDEX_FILE)
+    with _index_lock:
+        if _index_cache["index"] is None or _index_cache["mtime"] != mtime:
+            _index_cache["index"] = faiss.read_index(KB_INDEX_FILE)
+            _index_cache["mtime"] = mtime
+        return _index_cache["index"]
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def iter_segments(path: str) -> Iterator[Tuple[Optional[int], str]]:
+    """Yields (page_number or None, text) pieces of a document without reading it whole."""
+    if os.path.getsize(path) == 0:
+        return
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("pypdf is required to ingest PDF files")
+        reader = PdfReader(path)
+        for page_no, page in enumerate(reader.pages, start=1):
+            text = page.extract_text() or ""
+            if text.strip():
+                yield page_no, text
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.strip():
+                    yield None, line
+
+def iter_chunks(segments: Iterator[Tuple[Optional[int], str]], size: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[Optional[int], str]]:
+    """Overlapping windows of `size` words; each chunk carries the page its first word came from."""
+    overlap = min(overlap, size - 1)
+    buf: List[Tuple[str, Optional[int]]] = []
+    fresh = 0  # words in buf not yet emitted in any chunk
+    for page, text in segments:
+        for word in text.split():
+            buf.append((word, page))
+            fresh += 1
+            if len(buf) >= size:
+                yield buf[0][1], " ".join(w for w, _ in buf)
+                buf = buf[-overlap:] if overlap else []
+                fresh = 0
+    if fresh:
+        yield buf[0][1], " ".join(w for w, _ in buf)
+
+def _remove_document_chunks(conn, idx, document_id: int) -> None:
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM kb_chunks WHERE document_id = ?", (document_id,))
+    ids = [r["id"] for r in cur.fetchall()]
+    if ids:
+        idx.remove_ids(np.array(ids, dtype="int64"))
+    cur.execute("DELETE FROM kb_chunks WHERE document_id = ?", (document_id,))
+
+def _flush(conn, idx, document_id: int, batch: List[Tuple[int, Optional[int], str]]) -> List[int]:
+    cur = conn.cursor()
+    ids = []
+    for chunk_index, page, text in batch:
+        cur.execute(
+            "INSERT INTO kb_chunks (document_id, chunk_index, page, text) VALUES (?, ?, ?, ?)",
+            (document_id, chunk_index, page, text),
+        )
+        ids.append(cur.lastrowid)
+    vecs = emb_model.encode([text for _, _, text in batch], batch_size=EMBED_BATCH)
+    vecs = _normalize(np.array(vecs, dtype="float32"))
+    idx.add_with_ids(vecs, np.array(ids, dtype="int64"))
+    return ids
+
+def ingest_file(path: str, idx=None, force: bool = False) -> Optional[int]:
+    """
+    Ingests one file; returns the number of chunks written, or None when the file is unchanged
+    (0 means it changed and now yields no chunks: its old vectors were still removed).
+    Pass `idx` to batch several files into one index save (see ingest_paths).
+    """
+    init_db()
+    path = os.path.abspath(path)
+    digest = file_hash(path)
+    own_index = idx is None
+    if own_index:
+        idx = _load_index()
+
+    conn = _conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id, content_hash FROM kb_documents WHERE path = ?", (path,))
+        row = cur.fetchone()
+        if row and row["content_hash"] == digest and not force:
+            return None
+
+        if row:
+            document_id = row["id"]
+            _remove_document_chunks(conn, idx, document_id)
+            # cleared until ingestion finishes, so an interrupted run is redone next time
+            cur.execute("UPDATE kb_documents SET content_hash = NULL, chunk_count = 0 WHERE id = ?", (document_id,))
+        else:
+            cur.execute("INSERT INTO kb_documents (path, content_hash) VALUES (?, NULL)", (path,))
+            document_id = cur.lastrowid
+        conn.commit()
+
+        count = 0
+        batch = []
+        added: List[int] = []
+        try:
+            for page, text in iter_chunks(iter_segments(path)):
+                batch.append((count, page, text))
+                count += 1
+                if len(batch) >= EMBED_BATCH:
+                    added += _flush(conn, idx, document_id, batch)
+                    batch = []
+            if batch:
+                added += _flush(conn, idx, document_id, batch)
+        except Exception:
+            # chunk rows roll back with the connection; drop their vectors too
+            conn.rollback()
+            if added:
+                idx.remove_ids(np.array(added, dtype="int64"))
+            if own_index:
+                _save_index(idx)
+            raise
+
+        if own_index:
+            _save_index(idx)
+        cur.execute(
+            "UPDATE kb_documents SET content_hash = ?, chunk_count = ?, ingested_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (digest, count, document_id),
+        )
+        conn.commit()
+        logger.info("ingested %s: %d chunks", path, count)
+        return count
+    finally:
+        conn.close()
+
+def _iter_files(paths: List[str]) -> Iterator[str]:
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _dirs, files in os.walk(p):
+                for name in sorted(files):
+                    if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif p.lower().endswith(SUPPORTED_EXTENSIONS):
+            yield p
+
+def ingest_paths(paths: List[str], prune: bool = False, force: bool = False) -> dict:
+    """
+    Ingests every supported file under `paths` (files or directories) incrementally.
+    With prune=True, documents previously ingested but no longer present are removed.
+    """
+    init_db()
+    idx = _load_index()
+    stats = {"files": 0, "updated": 0, "chunks": 0, "failed": 0, "pruned": 0}
+    seen = set()
+    for path in _iter_files(paths):
+        stats["files"] += 1
+        seen.add(os.path.abspath(path))
+        try:
+            n = ingest_file(path, idx=idx, force=force)
+        except Exception:
+            logger.exception("failed to ingest %s", path)
+            stats["failed"] += 1
+            # old chunks of the file are already gone from the DB; persist their removal from the index
+            _save_index(idx)
+            continue
+        if n is not None:
+            stats["updated"] += 1
+            stats["chunks"] += n
+            # save as we go so the index never lags the committed chunk rows by more than one file
+            _save_index(idx)
+
+    if prune:
+        conn = _conn()
+        cur = conn.cursor()
+        cur.execute("SELECT id, path FROM kb_documents")
+        for row in cur.fetchall():
+            if row["path"] not in seen:
+                _remove_document_chunks(conn, idx, row["id"])
+                cur.execute("DELETE FROM kb_documents WHERE id = ?", (row["id"],))
+                stats["pruned"] += 1
+        conn.commit()
+        conn.close()
+        if stats["pruned"]:
+            _save_index(idx)
+    return stats
+
+def query_knowledge(query: str, top_k: int = 3, min_score: float = KB_MIN_SCORE, query_vec: Optional[np.ndarray] = None) -> List[Tuple[int, float, str, dict]]:
+    """
+    Returns list of tuples (chunk_id, score, text, meta) with meta = {source, page},
+    best first, dropping matches below `min_score`. Pass `query_vec` (store.embed_query)
+    to reuse an embedding of `query`.
+    """
+    idx = _cached_index()
+    if idx is None or idx.ntotal == 0:
+        return []
+    q = embed_query(query) if query_vec is None else query_vec
+    D, I = idx.search(q, top_k)
+    hits = [(int(i), float(s)) for i, s in zip(I[0].tolist(), D[0].tolist()) if i >= 0 and s >= min_score]
+    if not hits:
+        return []
+
+    conn = _conn()
+    cur = conn.cursor()
+    placeholders = ",".join("?" for _ in hits)
+    cur.execute(
+        f"SELECT c.id, c.page, c.text, d.path FROM kb_chunks c JOIN kb_documents d ON d.id = c.document_id WHERE c.id IN ({placeholders})",
+        [i for i, _ in hits],
+    )
+    rows = {r["id"]: r for r in cur.fetchall()}
+    conn.close()
+
+    results = []
+    for chunk_id, score in hits:
+        row = rows.get(chunk_id)
+        if row:
+            meta = {"source": os.path.basename(row["path"]), "page": row["page"]}
+            results.append((chunk_id, score, row["text"], meta))
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Ingest documents into the Aarii knowledge base")
+    parser.add_argument("paths", nargs="+", help="files or directories (.pdf, .txt, .md)")
+    parser.add_argument("--prune", action="store_true", help="remove documents that are no longer present")
+    parser.add_argument("--force", action="store_true", help="re-ingest even if content is unchanged")
+    args = parser.parse_args()
+    print(json.dumps(ingest_paths(args.paths, prune=args.prune, force=args.force), indent=2))
@@ -1,10 +1,11 @@
 # backend/memory/store.py
 import os, json
+import threading
 import numpy as np
 import faiss
 import sqlite3
 from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 BASE = os.path.dirname(__file__)
 SQLITE_FILE = os.path.join(BASE, "..", "aarii_memory_meta.sqlite")
@@ -14,6 +15,9 @@ MODEL_NAME = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
 emb_model = SentenceTransformer(MODEL_NAME)
 EMBED_DIM = emb_model.get_sentence_embedding_dimension()
 
+# the index is read-modified-written as a whole; request threads share it through this lock
+_index_lock = threading.Lock()
+
 def _conn():
     c = sqlite3.connect(SQLITE_FILE, check_same_thread=False)
     c.row_factory = sqlite3.Row
@@ -42,9 +46,32 @@ def init_db():
 
 def _load_index():
     if os.path.exists(INDEX_FILE):
-        return faiss.read_index(INDEX_FILE)
-    # use normalized vectors -> IndexFlatIP works with normalized embeddings
-    idx = faiss.IndexFlatIP(EMBED_DIM)
+        idx = faiss.read_index(INDEX_FILE)
+        if not isinstance(idx, faiss.IndexIDMap):
+            idx = _migrate_positional_index(idx)
+        return idx
+    # use normalized vectors -> IndexFlatIP works with normalized embeddings;
+    # explicit ids (= memory row ids) so concurrent adds can't be mis-mapped
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(EMBED_DIM))
+
+def _migrate_positional_index(old):
+    """Older indexes were a plain IndexFlatIP addressed by position via `mapping`; re-key them by memory row id."""
+    idx = faiss.IndexIDMap2(faiss.IndexFlatIP(EMBED_DIM))
+    conn = _conn()
+    cur = conn.cursor()
+    cur.execute("SELECT faiss_index, memory_row_id, session_id FROM mapping")
+    rows = [r for r in cur.fetchall() if 0 <= r["faiss_index"] < old.ntotal]
+    if rows:
+        vecs = np.vstack([old.reconstruct(int(r["faiss_index"])) for r in rows]).astype("float32")
+        idx.add_with_ids(vecs, np.array([r["memory_row_id"] for r in rows], dtype="int64"))
+    cur.execute("DELETE FROM mapping")
+    cur.executemany(
+        "INSERT INTO mapping (faiss_index, memory_row_id, session_id) VALUES (?, ?, ?)",
+        [(r["memory_row_id"], r["memory_row_id"], r["session_id"]) for r in rows],
+    )
+    _save_index(idx)
+    conn.commit()
+    conn.close()
     return idx
 
 def _save_index(idx):
@@ -56,6 +83,10 @@ def _normalize(vecs: np.ndarray):
     norms[norms == 0] = 1.0
     return vecs / norms
 
+def embed_query(text: str) -> np.ndarray:
+    """Normalized (1, d) query vector; compute once and pass to query_memory / query_knowledge."""
+    return _normalize(np.array(emb_model.encode([text]), dtype='float32'))
+
 def add_memory(session_id: str, text: str, meta: dict = None):
     """
     Inserts memory text into SQLite and FAISS index; returns memory_row_id
@@ -72,46 +103,39 @@ def add_memory(session_id: str, text: str, meta: dict = None):
     vec = emb_model.encode([text])
     vec = _normalize(np.array(vec, dtype='float32'))
 
-    idx = _load_index()
-    before = idx.ntotal
-    idx.add(vec)
-    # new faiss index is 'before' (0-based)
-    faiss_idx = before
-    _save_index(idx)
+    with _index_lock:
+        idx = _load_index()
+        idx.add_with_ids(vec, np.array([rowid], dtype="int64"))
+        _save_index(idx)
 
-    # store mapping
+    # store mapping (faiss id == memory row id)
     conn = _conn()
     cur = conn.cursor()
-    cur.execute("INSERT INTO mapping (faiss_index, memory_row_id, session_id) VALUES (?, ?, ?)", (faiss_idx, rowid, session_id))
+    cur.execute("INSERT INTO mapping (faiss_index, memory_row_id, session_id) VALUES (?, ?, ?)", (rowid, rowid, session_id))
     conn.commit()
     conn.close()
     return rowid
 
-def query_memory(query: str, top_k: int = 5) -> List[Tuple[int, float, str, dict]]:
+def query_memory(query: str, top_k: int = 5, query_vec: Optional[np.ndarray] = None) -> List[Tuple[int, float, str, dict]]:
     """
-    Returns list of tuples (memory_row_id, score, text, meta)
+    Returns list of tuples (memory_row_id, score, text, meta).
+    Pass `query_vec` (from embed_query) to reuse an embedding of `query`.
     """
     init_db()
-    idx = _load_index()
-    if idx.ntotal == 0:
-        return []
-    q = emb_model.encode([query])
-    q = _normalize(np.array(q, dtype='float32'))
-    D, I = idx.search(q, top_k)
+    q = embed_query(query) if query_vec is None else query_vec
+    with _index_lock:
+        idx = _load_index()
+        if idx.ntotal == 0:
+            return []
+        D, I = idx.search(q, top_k)
     ids = I[0].tolist()
     scores = D[0].tolist()
     results = []
     conn = _conn()
     cur = conn.cursor()
-    for faiss_idx, score in zip(ids, scores):
-        if faiss_idx < 0:
-            continue
-        # lookup memory_row_id from mapping
-        cur.execute("SELECT memory_row_id FROM mapping WHERE faiss_index = ?", (faiss_idx,))
-        r = cur.fetchone()
-        if not r:
+    for mem_id, score in zip(ids, scores):
+        if mem_id < 0:
             continue
-        mem_id = r["memory_row_id"]
         cur.execute("SELECT id, text, meta FROM memory WHERE id = ?", (mem_id,))
         row = cur.fetchone()
         if row:
@@ -1,5 +1,5 @@
 # backend/routes/chat_routes.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 import logging
 from typing import List, Dict, Any
 
@@ -18,11 +18,31 @@ except Exception:
     DB_AVAILABLE = False
 
 try:
-    from backend.memory.store import query_memory, add_memory
+    from backend.memory.store import query_memory, add_memory, embed_query
     MEMORY_AVAILABLE = True
 except Exception:
     MEMORY_AVAILABLE = False
 
+try:
+    from backend.core.summarizer import get_summary, maybe_schedule_summary, HISTORY_WINDOW
+    SUMMARY_AVAILABLE = True
+except Exception:
+    SUMMARY_AVAILABLE = False
+    HISTORY_WINDOW = 12
+
+try:
+    from backend.core.admission import admission, AdmissionRejected
+    ADMISSION_AVAILABLE = True
+except Exception:
+    ADMISSION_AVAILABLE = False
+
+try:
+    from backend.memory.knowledge import query_knowledge
+    from backend.memory.store import embed_query
+    KNOWLEDGE_AVAILABLE = True
+except Exception:
+    KNOWLEDGE_AVAILABLE = False
+
 chat_bp = Blueprint("chat_bp", __name__)
 logger = logging.getLogger("aarii.chat_routes")
 
@@ -38,16 +58,26 @@ if CORE_AVAILABLE:
 else:
     logger.warning("Core not available: %s", globals().get("_core_import_error", "unknown"))
 
-def get_history_from_db(session_id: str, limit: int = 20) -> List[Dict[str, str]]:
+def get_history_from_db(session_id: str, limit: int = 20, after_id: int = 0) -> List[Dict[str, str]]:
+    """
+    Last `limit` user/assistant messages with ChatLog.id > after_id (rows already folded into
+    the session summary are skipped), oldest first.
+    """
     if not DB_AVAILABLE:
         return []
     try:
         db = SessionLocal()
-        rows = db.query(ChatLog).filter(ChatLog.session_id == session_id).order_by(ChatLog.timestamp.asc()).all()
+        # only the last `limit` user/assistant turns; the mode prompt lives in session settings,
+        # so legacy "system" rows are skipped instead of eating history slots
+        rows = (
+            db.query(ChatLog)
+            .filter(ChatLog.session_id == session_id, ChatLog.id > after_id, ChatLog.role.in_(("user", "assistant")))
+            .order_by(ChatLog.id.desc())
+            .limit(limit)
+            .all()
+        )
         db.close()
-        # take last `limit` messages
-        messages = [{"role": r.role, "content": r.content} for r in rows]
-        return messages[-limit:]
+        return [{"role": r.role, "content": r.content} for r in reversed(rows)]
     except Exception as e:
         logger.exception("history fetch failed: %s", e)
         return []
@@ -72,11 +102,35 @@ def _safe_add_memory(session_id: str, text: str, meta: Dict[str, Any] = None) ->
     except Exception:
         logger.exception("failed to add memory")
 
-def get_memory_system_msgs(session_id: str, user_message: str, top_k: int = 3) -> List[Dict[str, str]]:
-    if not MEMORY_AVAILABLE:
+def get_knowledge_system_msgs(user_message: str, top_k: int = 3, query_vec=None) -> List[Dict[str, str]]:
+    if not KNOWLEDGE_AVAILABLE:
         return []
     try:
-        mems = query_memory(user_message, top_k=top_k)
+        msgs = []
+        for _id, score, text, meta in query_knowledge(user_message, top_k=top_k, query_vec=query_vec):
+            source = meta.get("source", "docs")
+            if meta.get("page"):
+                source = f"{source} p.{meta['page']}"
+            msgs.append({"role": "system", "content": f"Knowledge ({source}, score={score:.3f}): {text}"})
+        return msgs
+    except Exception:
+        logger.exception("knowledge query failed")
+        return []
+
+def get_memory_system_msgs(session_id: str, user_message: str, top_k: int = 3, kb_top_k: int = 3) -> List[Dict[str, str]]:
+    """Knowledge-base passages first, then chat memories, as system messages."""
+    # one embedding of the message serves both lookups
+    query_vec = None
+    if KNOWLEDGE_AVAILABLE or MEMORY_AVAILABLE:
+        try:
+            query_vec = embed_query(user_message)
+        except Exception:
+            logger.exception("query embedding failed")
+    kb_msgs = get_knowledge_system_msgs(user_message, top_k=kb_top_k, query_vec=query_vec)
+    if not MEMORY_AVAILABLE:
+        return kb_msgs
+    try:
+        mems = query_memory(user_message, top_k=top_k, query_vec=query_vec)
         # Expect mems as iterable of (_id, score, text, meta) or (score, text)
         msgs = []
         for item in mems:
@@ -91,10 +145,37 @@ def get_memory_system_msgs(session_id: str, user_message: str, top_k: int = 3) -
             except Exception:
                 # On unexpected shape, stringify item
                 msgs.append({"role": "system", "content": f"Memory: {str(item)}"})
-        return msgs
+        return kb_msgs + msgs
     except Exception:
         logger.exception("memory query failed")
-        return []
+        return kb_msgs
+
+def _client_key() -> str:
+    # remote_addr is the proxy-appended hop (ProxyFix in app.py), never a client-supplied XFF entry
+    return request.remote_addr or "unknown"
+
+@chat_bp.before_request
+def _admit():
+    # CORS preflights never reach the engine
+    if not ADMISSION_AVAILABLE or request.endpoint != "chat_bp.chat" or request.method == "OPTIONS":
+        return None
+    data = request.get_json(force=True, silent=True) or {}
+    session_id = data.get("session_id")
+    if not isinstance(session_id, str) or not session_id.strip():
+        # anonymous callers get a bucket per client instead of sharing one
+        session_id = _client_key()
+    try:
+        admission.acquire(session_id, client=_client_key())
+    except AdmissionRejected as e:
+        logger.info("chat request rejected (%s) for session %s", e.reason, session_id)
+        return jsonify({"error": e.reason, "retry_after": e.retry_after}), e.status, {"Retry-After": str(e.retry_after)}
+    g.admitted = True
+    return None
+
+@chat_bp.teardown_request
+def _release(exc=None):
+    if g.pop("admitted", False):
+        admission.release()
 
 @chat_bp.route("/", methods=["POST"])
 def chat():
@@ -113,10 +194,10 @@ def chat():
     if not message:
         return jsonify({"reply": "Please send a non-empty message."}), 400
 
-    # Build history + memory system messages
-    history = get_history_from_db(session_id, limit=20)
+    # Build summary + raw history since the summary + memory system messages
+    summary, summarized_upto = get_summary(session_id) if SUMMARY_AVAILABLE else ("", 0)
+    history = get_history_from_db(session_id, limit=HISTORY_WINDOW, after_id=summarized_upto)
     mem_systems = get_memory_system_msgs(session_id, message, top_k=3)
-    combined_history = mem_systems + history
 
     # persist user message
     try:
@@ -128,7 +209,7 @@ def chat():
     # get reply from engine
     try:
         # engine.get_response expected to return (reply, meta)
-        reply, meta = engine.get_response(message, session_id=session_id, history=combined_history, max_history_messages=12)
+        reply, meta = engine.get_response(message, session_id=session_id, history=history, max_history_messages=HISTORY_WINDOW, summary=summary, context=mem_systems)
     except Exception as e:
         logger.exception("Engine get_response failed: %s", e)
         return jsonify({"error": "engine_error", "message": str(e)}), 500
@@ -140,8 +221,27 @@ def chat():
     except Exception:
         logger.exception("error while saving assistant reply")
 
+    # fold older turns into the rolling summary in the background (+2: this turn's user/assistant rows)
+    if SUMMARY_AVAILABLE and not (isinstance(meta, dict) and meta.get("error")):
+        try:
+            maybe_schedule_summary(session_id, len(history) + 2, engine.summarize)
+        except Exception:
+            logger.exception("failed to schedule summary update")
+
     status = 200
+    headers = {}
     if isinstance(meta, dict) and meta.get("error"):
         status = 500
-
-    return jsonify({"reply": reply, "meta": meta}), status
+        if meta.get("unavailable"):
+            # upstream down / circuit open: tell clients to back off instead of hammering us
+            status = 503
+            headers["Retry-After"] = "5"
+
+    return jsonify({"reply": reply, "meta": meta}), status, headers
+
+@chat_bp.route("/stats", methods=["GET"])
+def stats():
+    out = {"llm": engine.llm.stats() if engine is not None else None}
+    if ADMISSION_AVAILABLE:
+        out["admission"] = admission.stats()
+    return jsonify(out)
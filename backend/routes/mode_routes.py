@@ -1,23 +1,68 @@
 # backend/routes/mode_routes.py
+import os
+import math
 from flask import Blueprint, request, jsonify
 try:
-    from database.models import SessionLocal, ChatLog
-    DB_AVAILABLE = True
+    from backend.core.session_settings import get_session_settings, set_session_settings, DB_AVAILABLE
 except Exception:
     DB_AVAILABLE = False
 
 mode_bp = Blueprint("mode_bp", __name__)
 
+# upper bound for a per-session max_tokens (the model's completion limit)
+MAX_TOKENS_LIMIT = int(os.getenv("AARII_MAX_TOKENS_LIMIT", "8192"))
+
+def _optional_str(data: dict, key: str):
+    value = data[key]
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value or None
+
+def _parse_settings(data: dict) -> dict:
+    # only fields present in the request are updated; an explicit null clears a field
+    fields = {}
+    if "mode" in data:
+        fields["mode"] = _optional_str(data, "mode")
+    if "prompt" in data:
+        fields["system_prompt"] = _optional_str(data, "prompt")
+    if "temperature" in data and data["temperature"] is not None:
+        if isinstance(data["temperature"], bool):
+            raise ValueError("temperature must be a number")
+        temperature = float(data["temperature"])
+        if not math.isfinite(temperature) or not 0 <= temperature <= 2:
+            raise ValueError("temperature must be between 0 and 2")
+        fields["temperature"] = temperature
+    elif "temperature" in data:
+        fields["temperature"] = None
+    if "max_tokens" in data and data["max_tokens"] is not None:
+        if isinstance(data["max_tokens"], bool) or (isinstance(data["max_tokens"], float) and not data["max_tokens"].is_integer()):
+            raise ValueError("max_tokens must be an integer")
+        max_tokens = int(data["max_tokens"])
+        if not 1 <= max_tokens <= MAX_TOKENS_LIMIT:
+            raise ValueError(f"max_tokens must be between 1 and {MAX_TOKENS_LIMIT}")
+        fields["max_tokens"] = max_tokens
+    elif "max_tokens" in data:
+        fields["max_tokens"] = None
+    return fields
+
 @mode_bp.route("/mode", methods=["POST"])
 def set_mode():
     data = request.get_json(force=True) or {}
     session_id = data.get("session_id", "default")
-    prompt = data.get("prompt", "")
+    if not isinstance(session_id, str) or not session_id.strip() or len(session_id) > 128:
+        return jsonify({"error": "invalid_session_id", "message": "session_id must be a non-empty string of at most 128 chars"}), 400
+    if not DB_AVAILABLE:
+        return jsonify({"error":"db missing"}), 500
+    try:
+        fields = _parse_settings(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": "invalid_settings", "message": str(e)}), 400
+    settings = set_session_settings(session_id, **fields)
+    return jsonify({"ok": True, "settings": settings})
+
+@mode_bp.route("/mode", methods=["GET"])
+def get_mode():
+    session_id = request.args.get("session_id", "default")
     if not DB_AVAILABLE:
         return jsonify({"error":"db missing"}), 500
-    db = SessionLocal()
-    row = ChatLog(session_id=session_id, role="system", content=prompt)
-    db.add(row)
-    db.commit()
-    db.close()
-    return jsonify({"ok": True})
+    return jsonify({"session_id": session_id, "settings": get_session_settings(session_id) or {}})